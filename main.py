@@ -1,10 +1,10 @@
 # main.py - FastAPI backend with full AQI computation
-from fastapi import FastAPI
+from fastapi import Body, FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import joblib, json, os
+import joblib, json, math, orjson, os, threading
+from functools import lru_cache
 import numpy as np
-from typing import Optional, Dict, Any
+from typing import Optional
 
 app = FastAPI(
     title="Metro Manila Air Quality Risk Prediction API (with full AQI)",
@@ -23,13 +23,30 @@ app.add_middleware(
 BASE_DIR = os.path.dirname(__file__)
 MODEL_DIR = os.path.join(BASE_DIR, "model")
 
-# load model bundle (must exist)
+# load model bundle (must exist); numpy arrays are memory-mapped read-only
 bundle_path = os.path.join(MODEL_DIR, "air_pollution_model_bundle.pkl")
-bundle = joblib.load(bundle_path)
+bundle = joblib.load(bundle_path, mmap_mode="r")
 
 pipeline = bundle["pipeline"]
 label_encoder = bundle["label_encoder"]
 FEATURES = bundle["features"]
+_FEAT_IDX = {f: i for i, f in enumerate(FEATURES)}
+# probability keys, and the decoded label for each pipeline output column
+_CLASSES = tuple(label_encoder.classes_.tolist())
+_PRED_LABELS = tuple(label_encoder.inverse_transform(pipeline.classes_).tolist())
+
+# Reusable (1, n_features) input row. Sync endpoints run in FastAPI's
+# threadpool, so each worker thread gets its own buffer.
+_scratch = threading.local()
+
+def _input_row() -> np.ndarray:
+    row = getattr(_scratch, "row", None)
+    if row is None:
+        row = _scratch.row = np.zeros((1, len(FEATURES)))
+    return row
+
+# warm up the pipeline so the first /predict doesn't pay first-call costs
+pipeline.predict_proba(np.zeros((1, len(FEATURES))))
 
 # dashboard files (optional)
 dashboard_by_city = {}
@@ -46,6 +63,22 @@ try:
 except Exception:
     dashboard_data = {}
 
+# lowercase city name -> dashboard_by_city key, for case-insensitive lookups
+_CITY_LC = {c.lower(): c for c in dashboard_by_city}
+
+# /cities payload: dashboard_by_city keys, else a fallback sample list (Metro Manila)
+_CITIES_SORTED = tuple(sorted(dashboard_by_city)) if dashboard_by_city else (
+    "Caloocan","Las Piñas","Makati City","Malabon","Mandaluyong City",
+    "Navotas","Parañaque City","Pasig","Quezon City","San Juan","Taguig","Valenzuela","Manila")
+_CITIES_CACHE_CONTROL = "public, max-age=3600"
+
+# Static GET payloads, serialized once so requests just write the bytes.
+# /dashboard falls back to minimal info when dashboard_data is missing.
+_CITIES_JSON = orjson.dumps({"cities": _CITIES_SORTED})
+_DASHBOARD_JSON = orjson.dumps(
+    dashboard_data if dashboard_data else {"model_accuracy": bundle.get("accuracy", None)}
+)
+
 # -----------------------
 # AQI breakpoint tables
 # -----------------------
@@ -115,51 +148,107 @@ AQI_BREAKPOINTS = {
 }
 
 # AQI categories
+# Upper (inclusive) AQI bound of each category; anything above 300 is Hazardous
+_AQI_BOUNDS = np.array([50, 100, 150, 200, 300], dtype=np.float64)
+_AQI_CATS = ("Good", "Moderate", "Unhealthy for Sensitive Groups", "Unhealthy",
+             "Very Unhealthy", "Hazardous")
+
 def aqi_category(aqi_val: float) -> str:
-    if aqi_val <= 50:
-        return "Good"
-    if aqi_val <= 100:
-        return "Moderate"
-    if aqi_val <= 150:
-        return "Unhealthy for Sensitive Groups"
-    if aqi_val <= 200:
-        return "Unhealthy"
-    if aqi_val <= 300:
-        return "Very Unhealthy"
-    return "Hazardous"
+    return _AQI_CATS[int(np.searchsorted(_AQI_BOUNDS, aqi_val, side="left"))]
 
 # Linear interpolation formula
 def linear_iaqi(Cp, Clow, Chigh, Ilow, Ihigh):
     return ((Ihigh - Ilow) / (Chigh - Clow)) * (Cp - Clow) + Ilow
 
+# Breakpoint tables as interpolation knots, built once at import.
+# Each band contributes (Clow, Ilow) and (Chigh, Ihigh); the small gaps between
+# bands are bridged linearly. np.interp clamps at the ends, so readings above
+# the highest breakpoint are extrapolated with the last band explicitly.
+def _aqi_knots(rows):
+    xp, fp = [], []
+    for (Clow, Chigh, Ilow, Ihigh) in rows:
+        xp += [Clow, Chigh]
+        fp += [Ilow, Ihigh]
+    return np.array(xp, dtype=np.float64), np.array(fp, dtype=np.float64)
+
+_XP, _FP = {}, {}
+for _pol, _rows in AQI_BREAKPOINTS.items():
+    _XP[_pol], _FP[_pol] = _aqi_knots(_rows)
+
+# Pollutants in response order, and every request field that feeds the model
+_POLLUTANTS = ("pm25", "pm10", "no2", "so2", "co", "o3")
+_INPUT_FIELDS = _POLLUTANTS + ("temperature", "humidity")
+
+# All knot tables laid end to end on one axis: pollutant i is shifted by
+# _X_OFF[i], far enough that the ranges never overlap. Readings are clipped to
+# their own table's range first, so a single np.interp covers every pollutant.
+_X_MAX = np.array([_XP[p][-1] for p in _POLLUTANTS])
+_X_OFF = np.arange(len(_POLLUTANTS)) * (_X_MAX.max() + 1.0)
+_XP_ALL = np.concatenate([_XP[p] + off for p, off in zip(_POLLUTANTS, _X_OFF)])
+_FP_ALL = np.concatenate([_FP[p] for p in _POLLUTANTS])
+# last band of each pollutant as (Clow, Chigh, Ilow, Ihigh) rows, for extrapolation
+_BP_LAST = np.array([AQI_BREAKPOINTS[p][-1] for p in _POLLUTANTS], dtype=np.float64).T
+
+def compute_sub_aqi_all(values: np.ndarray) -> np.ndarray:
+    """Compute sub-indices for all pollutants (in _POLLUTANTS order, NaN = missing)."""
+    out = np.interp(np.clip(values, 0.0, _X_MAX) + _X_OFF, _XP_ALL, _FP_ALL)
+    # if value is above highest breakpoint, extrapolate using last interval
+    above = values > _X_MAX
+    if above.any():
+        out[above] = linear_iaqi(values[above], *_BP_LAST[:, above])
+    return out
+
 def compute_sub_aqi(pollutant: str, value: float) -> Optional[float]:
     """Compute sub-index (AQI) for a pollutant based on breakpoints."""
-    if value is None:
+    if value is None or pollutant not in _POLLUTANTS:
         return None
-    if pollutant not in AQI_BREAKPOINTS:
-        return None
-    for (Clow, Chigh, Ilow, Ihigh) in AQI_BREAKPOINTS[pollutant]:
-        if Clow <= value <= Chigh:
-            return max(0.0, linear_iaqi(value, Clow, Chigh, Ilow, Ihigh))
-    # if value is above highest breakpoint, extrapolate using last interval
-    last = AQI_BREAKPOINTS[pollutant][-1]
-    Clow, Chigh, Ilow, Ihigh = last
-    if value > Chigh:
-        # extrapolate linearly
-        return max(0.0, linear_iaqi(value, Clow, Chigh, Ilow, Ihigh))
-    return None
-
-# Request model
-class PredictRequest(BaseModel):
-    city: Optional[str] = None
-    pm25: Optional[float] = None
-    pm10: Optional[float] = None
-    no2: Optional[float] = None
-    so2: Optional[float] = None
-    co: Optional[float] = None
-    o3: Optional[float] = None
-    temperature: Optional[float] = None
-    humidity: Optional[float] = None
+    # only this pollutant is present; the rest stay NaN (missing)
+    i = _POLLUTANTS.index(pollutant)
+    values = np.full(len(_POLLUTANTS), np.nan)
+    values[i] = value
+    return float(compute_sub_aqi_all(values)[i])
+
+@lru_cache(maxsize=1024)
+def _predict_core(values: tuple) -> tuple:
+    """Predict risk and AQI for inputs in _INPUT_FIELDS order (None = missing)."""
+    # ensure we have all features required by pipeline (missing ones stay 0.0)
+    arr = _input_row()
+    arr.fill(0.0)
+    for f, v in zip(_INPUT_FIELDS, values):
+        i = _FEAT_IDX.get(f)
+        if i is not None and v is not None:
+            arr[0, i] = v
+
+    # Predict using pipeline; the predicted class is the most probable one,
+    # so a single predict_proba pass gives both
+    proba = pipeline.predict_proba(arr)[0]
+    pred_label = _PRED_LABELS[proba.argmax()]
+
+    # Compute sub-AQIs for pollutants
+    # units: make sure values are in same units as breakpoints
+    # (we assume backend receives pm in μg/m3, gases in ppb except CO in ppm)
+    vals = np.array(values[:len(_POLLUTANTS)], dtype=np.float64)
+    sub_vec = np.round(compute_sub_aqi_all(vals), 1)
+    subs = sub_vec.tolist()
+    sub_aqi = tuple(None if np.isnan(sub) else sub for sub in subs)
+
+    # Determine overall AQI and main pollutant
+    # highest sub-index wins (NaN = missing pollutant)
+    if not np.isnan(sub_vec).all():
+        i = int(np.nanargmax(sub_vec))
+        overall_aqi = subs[i]
+        main_pollutant = _POLLUTANTS[i]
+    else:
+        overall_aqi = None
+        main_pollutant = None
+
+    # aqi category
+    overall_cat = aqi_category(overall_aqi) if overall_aqi is not None else None
+
+    # (prediction, probabilities, sub_aqi, aqi, aqi_category, main_pollutant);
+    # tuples aligned with _CLASSES / _POLLUTANTS so cached results stay immutable
+    return (pred_label, tuple(proba.tolist()), sub_aqi,
+            overall_aqi, overall_cat, main_pollutant)
 
 @app.get("/")
 def home():
@@ -167,107 +256,64 @@ def home():
 
 @app.get("/cities")
 def get_cities():
-    # prefer dashboard_by_city keys, else return static if empty
-    if dashboard_by_city:
-        return {"cities": sorted(list(dashboard_by_city.keys()))}
-    # fallback sample list (Metro Manila)
-    sample = ["Caloocan","Las Piñas","Makati City","Malabon","Mandaluyong City",
-              "Navotas","Parañaque City","Pasig","Quezon City","San Juan","Taguig","Valenzuela","Manila"]
-    return {"cities": sample}
+    # city list is fixed for the life of the process, so let clients cache it
+    return Response(_CITIES_JSON, media_type="application/json",
+                    headers={"Cache-Control": _CITIES_CACHE_CONTROL})
 
 @app.get("/dashboard")
 def get_dashboard():
-    # Return dashboard_data if available, else minimal info
-    if dashboard_data:
-        return dashboard_data
-    return {"model_accuracy": bundle.get("accuracy", None)}
+    return Response(_DASHBOARD_JSON, media_type="application/json")
 
 @app.post("/predict")
-def predict(req: PredictRequest):
+def predict(data: dict = Body(...)):
+    # Sync on purpose: FastAPI runs it in the threadpool, so a cache-miss
+    # predict_proba never blocks the event loop. The body is taken as a plain
+    # JSON object and the nine optional fields are cast by hand below.
+    city = data.get("city")
+    if city is not None and not isinstance(city, str):
+        raise HTTPException(status_code=422, detail="city must be a string")
+
     # Determine inputs: prefer dashboard_by_city latest_inputs if city provided
     inputs = {}
-    if req.city:
-        city = req.city
+    if city:
         # attempt to find in dashboard_by_city (case-insensitive)
-        found = None
-        for c in dashboard_by_city.keys():
-            if c.lower() == city.lower():
-                found = c
-                break
+        found = _CITY_LC.get(city.lower())
         if found:
-            inputs = dashboard_by_city[found].get("latest_inputs", {})
+            # copy so explicit fields below don't overwrite the cached city data
+            inputs = dict(dashboard_by_city[found].get("latest_inputs", {}))
         else:
             # if not in dashboard_by_city, allow using provided fields only
             inputs = {}
     # overwrite with any explicit fields in request
-    for f in ["pm25","pm10","no2","so2","co","o3","temperature","humidity"]:
-        val = getattr(req, f)
+    for f in _INPUT_FIELDS:
+        val = data.get(f)
         if val is not None:
-            inputs[f] = float(val)
-
-    # ensure we have all features required by pipeline
-    X = []
-    for feat in FEATURES:
-        v = inputs.get(feat, 0.0)
-        try:
-            X.append(float(v))
-        except:
-            X.append(0.0)
-    arr = np.array([X])
-
-    # Predict using pipeline
-    pred_enc = pipeline.predict(arr)[0]
-    pred_label = label_encoder.inverse_transform([pred_enc])[0]
-    proba = pipeline.predict_proba(arr)[0]
-    proba_dict = {label_encoder.classes_[i]: float(proba[i]) for i in range(len(proba))}
-
-    # Compute sub-AQIs for pollutants
-    # Map input keys to pollutant names used in AQI_BREAKPOINTS
-    pollutant_map = {
-        "pm25": "pm25",
-        "pm10": "pm10",
-        "no2": "no2",
-        "so2": "so2",
-        "co": "co",
-        "o3": "o3"
-    }
-    sub_aqi: Dict[str, Any] = {}
-    for key, pol in pollutant_map.items():
-        val = inputs.get(key, None)
-        if val is None:
-            sub_aqi[key] = None
-        else:
-            # units: make sure values are in same units as breakpoints
-            # (we assume backend receives pm in μg/m3, gases in ppb except CO in ppm)
-            sub = compute_sub_aqi(pol, float(val))
-            sub_aqi[key] = None if sub is None else round(float(sub), 1)
-
-    # Determine overall AQI and main pollutant
-    # use sub_aqi values (ignore None)
-    valid_subs = {k: v for k, v in sub_aqi.items() if v is not None}
-    if valid_subs:
-        overall_aqi = max(valid_subs.values())
-        main_pollutant = max(valid_subs, key=lambda k: valid_subs[k])
-    else:
-        overall_aqi = None
-        main_pollutant = None
-
-    # aqi category
-    overall_cat = aqi_category(overall_aqi) if overall_aqi is not None else None
+            try:
+                num = float(val)
+            except (TypeError, ValueError, OverflowError):
+                raise HTTPException(status_code=422, detail=f"{f} must be a number") from None
+            if not math.isfinite(num):
+                raise HTTPException(status_code=422, detail=f"{f} must be a number")
+            inputs[f] = num
+
+    # exact inputs are the cache key; repeat requests (e.g. dashboard refreshes
+    # of a city's latest_inputs) send identical floats and hit the cache
+    values = tuple(inputs.get(f) for f in _INPUT_FIELDS)
+    pred_label, proba, sub_aqi, overall_aqi, overall_cat, main_pollutant = _predict_core(values)
 
     # Build response
     response = {
-        "city": req.city,
+        "city": city,
         "prediction": pred_label,
-        "probabilities": proba_dict,
-        "inputs_used": {k: float(v) if v is not None else None for k, v in inputs.items()},
-        "sub_aqi": sub_aqi,
-        "aqi": round(float(overall_aqi), 1) if overall_aqi is not None else None,
+        "probabilities": dict(zip(_CLASSES, proba)),
+        "inputs_used": inputs,
+        "sub_aqi": dict(zip(_POLLUTANTS, sub_aqi)),
+        "aqi": overall_aqi,
         "aqi_category": overall_cat,
         "main_pollutant": main_pollutant
     }
 
-    return response
+    return Response(orjson.dumps(response), media_type="application/json")
 
 
 # NOTE: below we still compute BASE_DIR as before, but allow overrides via env vars.